@@ -35,6 +35,9 @@ class Config(object):
     _stack = collections.deque()
     _configs = set()
 
+    # immutable snapshot of _configs, replaced on each register()
+    _all_configs_frozenset = frozenset()
+
     def _set_name(self, db):
         if db.dialect.server_version_info:
             svi = ".".join(str(tok) for tok in db.dialect.server_version_info)
@@ -51,6 +54,7 @@ class Config(object):
         """
         cfg = Config(db, db_opts, options, file_config)
         cls._configs.add(cfg)
+        cls._all_configs_frozenset = frozenset(cls._configs)
         return cfg
 
     @classmethod
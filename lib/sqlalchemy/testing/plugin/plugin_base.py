@@ -17,6 +17,7 @@ from __future__ import absolute_import
 
 import sys
 import re
+import importlib
 
 py3k = sys.version_info >= (3, 0)
 
@@ -35,6 +36,7 @@ assertions = None
 requirements = None
 config = None
 testing = None
+provision = None
 util = None
 file_config = None
 
@@ -44,6 +46,10 @@ include_tags = set()
 exclude_tags = set()
 options = None
 
+_DB_TOKEN_RE = re.compile(r'[,\s]+')
+_SUB_TEST_NAME_RE = re.compile(r'[_\[\]\.]+')
+_SUB_TEST_NAME_TRAILING_RE = re.compile(r'_+$')
+
 
 def setup_options(make_option):
     make_option("--log-info", action="callback", type="string", callback=_log,
@@ -148,8 +154,7 @@ def pre_begin(opt):
     """things to set up early, before coverage might be setup."""
     global options
     options = opt
-    for fn in pre_configure:
-        fn(options, file_config)
+    _run_configure_hooks(pre_configure)
 
 
 def set_coverage_flag(value):
@@ -165,22 +170,32 @@ def set_skip_test(exc):
 
 def post_begin():
     """things to set up later, once we know coverage is running."""
+    _late_imports()
+
     # Lazy setup of other options (post coverage)
-    for fn in post_configure:
-        fn(options, file_config)
+    _run_configure_hooks(post_configure)
+
+    warnings.setup_filters()
+
+
+_late_imports_done = False
 
-    # late imports, has to happen after config as well
-    # as nose plugins like coverage
+
+def _late_imports():
+    # late imports, has to happen after nose plugins like coverage;
+    # these are shared by the post_configure hooks and the
+    # per-test functions below
     global util, fixtures, engines, exclusions, \
         assertions, warnings, profiling,\
-        config, testing
+        config, testing, provision, _late_imports_done
+    if _late_imports_done:
+        return
     from sqlalchemy import testing # noqa
     from sqlalchemy.testing import fixtures, engines, exclusions  # noqa
     from sqlalchemy.testing import assertions, warnings, profiling # noqa
-    from sqlalchemy.testing import config  # noqa
+    from sqlalchemy.testing import config, provision  # noqa
     from sqlalchemy import util  # noqa
-    warnings.setup_filters()
-
+    _late_imports_done = True
 
 
 def _log(opt_str, value, parser):
@@ -217,14 +232,41 @@ pre_configure = []
 post_configure = []
 
 
-def pre(fn):
-    pre_configure.append(fn)
+def _configure_hook(hooks, fn, trigger):
+    if fn is None:
+        return lambda fn: _configure_hook(hooks, fn, trigger)
+    assert callable(fn), \
+        "hook %r is not callable; pass the option name as trigger=" % (fn, )
+    hooks.append((trigger, fn))
     return fn
 
 
-def post(fn):
-    post_configure.append(fn)
-    return fn
+def pre(fn=None, trigger=None):
+    """Register a hook to run in :func:`.pre_begin`.
+
+    If ``trigger`` is given, it names an option attribute; the hook
+    is only invoked when that option is set.
+
+    """
+    return _configure_hook(pre_configure, fn, trigger)
+
+
+def post(fn=None, trigger=None):
+    """Register a hook to run in :func:`.post_begin`.
+
+    If ``trigger`` is given, it names an option attribute; the hook
+    is only invoked when that option is set.
+
+    """
+    return _configure_hook(post_configure, fn, trigger)
+
+
+def _run_configure_hooks(hooks):
+    # hooks are run in registration order, as later hooks
+    # rely on state set up by earlier ones
+    for trigger, fn in hooks:
+        if trigger is None or getattr(options, trigger, None):
+            fn(options, file_config)
 
 
 @pre
@@ -233,13 +275,13 @@ def _setup_options(opt, file_config):
     options = opt
 
 
-@pre
+@pre(trigger="nomemory")
 def _set_nomemory(opt, file_config):
     if opt.nomemory:
         exclude_tags.add("memory_intensive")
 
 
-@pre
+@pre(trigger="cdecimal")
 def _monkeypatch_cdecimal(options, file_config):
     if options.cdecimal:
         import cdecimal
@@ -248,26 +290,21 @@ def _monkeypatch_cdecimal(options, file_config):
 
 @post
 def _init_skiptest(options, file_config):
-    from sqlalchemy.testing import config
-
     config._skip_test_exception = _skip_test_exception
 
 
 @post
 def _engine_uri(options, file_config):
-    from sqlalchemy.testing import config
-    from sqlalchemy import testing
-    from sqlalchemy.testing import provision
-
     if options.dburi:
         db_urls = list(options.dburi)
     else:
         db_urls = []
 
     if options.db:
+        known_dbs = frozenset(file_config.options('db'))
         for db_token in options.db:
-            for db in re.split(r'[,\s]+', db_token):
-                if db not in file_config.options('db'):
+            for db in _DB_TOKEN_RE.split(db_token):
+                if db not in known_dbs:
                     raise RuntimeError(
                         "Unknown URI specifier '%s'.  "
                         "Specify --dbs for known uris."
@@ -300,6 +337,8 @@ def _requirements(options, file_config):
 
 
 def _setup_requirements(argument):
+    # called from option parsing via --requirements, ahead of
+    # post_begin(), so imports are local here
     from sqlalchemy.testing import config
     from sqlalchemy import testing
 
@@ -308,19 +347,15 @@ def _setup_requirements(argument):
 
     modname, clsname = argument.split(":")
 
-    # importlib.import_module() only introduced in 2.7, a little
-    # late
-    mod = __import__(modname)
-    for component in modname.split(".")[1:]:
-        mod = getattr(mod, component)
+    mod = importlib.import_module(modname)
     req_cls = getattr(mod, clsname)
 
     config.requirements = testing.requires = req_cls()
 
 
-@post
+@post(trigger="dropfirst")
 def _prep_testing_database(options, file_config):
-    from sqlalchemy.testing import config, util
+    from sqlalchemy.testing import util
     from sqlalchemy.testing.exclusions import against
     from sqlalchemy import schema, inspect
 
@@ -328,32 +363,30 @@ def _prep_testing_database(options, file_config):
         for cfg in config.Config.all_configs():
             e = cfg.db
             inspector = inspect(e)
-            try:
-                view_names = inspector.get_view_names()
-            except NotImplementedError:
-                pass
-            else:
-                for vname in view_names:
-                    e.execute(schema._DropView(
-                        schema.Table(vname, schema.MetaData())
-                    ))
-
-            if config.requirements.schemas.enabled_for_config(cfg):
-                try:
-                    view_names = inspector.get_view_names(
-                        schema="test_schema")
-                except NotImplementedError:
-                    pass
-                else:
+            use_schemas = config.requirements.schemas.enabled_for_config(cfg)
+
+            view_schemas = [None]
+            if use_schemas:
+                view_schemas.append("test_schema")
+
+            # drop all views on a single connection, sharing one
+            # MetaData per schema
+            with e.connect() as conn:
+                for view_schema in view_schemas:
+                    try:
+                        view_names = inspector.get_view_names(
+                            schema=view_schema)
+                    except NotImplementedError:
+                        continue
+                    md = schema.MetaData()
                     for vname in view_names:
-                        e.execute(schema._DropView(
-                            schema.Table(vname, schema.MetaData(),
-                                         schema="test_schema")
+                        conn.execute(schema._DropView(
+                            schema.Table(vname, md, schema=view_schema)
                         ))
 
             util.drop_all_tables(e, inspector)
 
-            if config.requirements.schemas.enabled_for_config(cfg):
+            if use_schemas:
                 util.drop_all_tables(e, inspector, schema=cfg.test_schema)
 
             if against(cfg, "postgresql"):
@@ -365,7 +398,7 @@ def _prep_testing_database(options, file_config):
                             schema=enum['schema'])))
 
 
-@post
+@post(trigger="reversetop")
 def _reverse_topological(options, file_config):
     if options.reversetop:
         from sqlalchemy.orm.util import randomize_unitofwork
@@ -374,19 +407,30 @@ def _reverse_topological(options, file_config):
 
 @post
 def _post_setup_options(opt, file_config):
-    from sqlalchemy.testing import config
     config.options = options
     config.file_config = file_config
 
 
 @post
 def _setup_profiling(options, file_config):
-    from sqlalchemy.testing import profiling
     profiling._profile_stats = profiling.ProfileStatsFile(
         file_config.get('sqla_testing', 'profile_file'))
 
 
+_want_class_cache = {}
+
+
 def want_class(cls):
+    # test classes don't change shape during a run, so the
+    # result is computed once per class
+    try:
+        return _want_class_cache[cls]
+    except KeyError:
+        result = _want_class_cache[cls] = _want_class(cls)
+        return result
+
+
+def _want_class(cls):
     if not issubclass(cls, fixtures.TestBase):
         return False
     elif cls.__name__.startswith('_'):
@@ -425,29 +469,33 @@ def want_method(cls, fn):
 def generate_sub_tests(cls, module):
     if getattr(cls, '__backend__', False):
         for cfg in _possible_configs_for_cls(cls):
-            orig_name = cls.__name__
-
-            # we can have special chars in these names except for the
-            # pytest junit plugin, which is tripped up by the brackets
-            # and periods, so sanitize
-
-            alpha_name = re.sub('[_\[\]\.]+', '_', cfg.name)
-            alpha_name = re.sub('_+$', '', alpha_name)
-            name = "%s_%s" % (cls.__name__, alpha_name)
-            subcls = type(
-                name,
-                (cls, ),
-                {
-                    "_sa_orig_cls_name": orig_name,
-                    "__only_on_config__": cfg
-                }
-            )
-            setattr(module, name, subcls)
+            subcls = _make_sub_test(cls, cfg)
+            setattr(module, subcls.__name__, subcls)
             yield subcls
     else:
         yield cls
 
 
+def _make_sub_test(cls, cfg):
+    orig_name = cls.__name__
+
+    # we can have special chars in these names except for the
+    # pytest junit plugin, which is tripped up by the brackets
+    # and periods, so sanitize
+
+    alpha_name = _SUB_TEST_NAME_RE.sub('_', cfg.name)
+    alpha_name = _SUB_TEST_NAME_TRAILING_RE.sub('', alpha_name)
+    name = "%s_%s" % (cls.__name__, alpha_name)
+    return type(
+        name,
+        (cls, ),
+        {
+            "_sa_orig_cls_name": orig_name,
+            "__only_on_config__": cfg
+        }
+    )
+
+
 def start_test_class(cls):
     _do_skips(cls)
     _setup_engine(cls)
@@ -480,14 +528,24 @@ def _setup_engine(cls):
         config._current.push_engine(eng, testing)
 
 
+_test_id_prefixes = {}
+
+
 def before_test(test, test_module_name, test_class, test_name):
 
     # like a nose id, e.g.:
     # "test.aaa_profiling.test_compiler.CompileTest.test_update_whereclause"
 
-    name = getattr(test_class, '_sa_orig_cls_name', test_class.__name__)
+    # the "<module>.<class>." portion is the same for every test
+    # in a class, so compute it once
+    key = (test_module_name, test_class)
+    try:
+        prefix = _test_id_prefixes[key]
+    except KeyError:
+        name = getattr(test_class, '_sa_orig_cls_name', test_class.__name__)
+        prefix = _test_id_prefixes[key] = "%s.%s." % (test_module_name, name)
 
-    id_ = "%s.%s.%s" % (test_module_name, name, test_name)
+    id_ = prefix + test_name
 
     profiling._current_test = id_
 
@@ -496,55 +554,135 @@ def after_test(test):
     engines.testing_reaper._after_test_ctx()
 
 
-def _possible_configs_for_cls(cls, reasons=None):
-    all_configs = set(config.Config.all_configs())
+_possible_configs_cache = {}
 
-    if cls.__unsupported_on__:
-        spec = exclusions.db_spec(*cls.__unsupported_on__)
-        for config_obj in list(all_configs):
-            if spec(config_obj):
-                all_configs.remove(config_obj)
 
-    if getattr(cls, '__only_on__', None):
-        spec = exclusions.db_spec(*util.to_list(cls.__only_on__))
-        for config_obj in list(all_configs):
-            if not spec(config_obj):
-                all_configs.remove(config_obj)
+def _possible_configs_for_cls(cls):
+    # memoized per class; the key includes the snapshot of registered
+    # configs, which is replaced whenever a new Config is registered
+    key = (cls, config.Config._all_configs_frozenset)
+    try:
+        all_configs = _possible_configs_cache[key]
+    except KeyError:
+        all_configs = _possible_configs_cache[key] = frozenset(
+            _compute_possible_configs_for_cls(cls))
+    return set(all_configs)
+
+
+def _compute_possible_configs_for_cls(cls, reasons=None):
+    all_configs = set(config.Config._all_configs_frozenset)
+
+    spec = _spec_for_cls(cls, '__unsupported_on__', '_sa_unsupported_spec')
+    if spec is not None:
+        all_configs = set(
+            config_obj for config_obj in all_configs
+            if not spec(config_obj))
+
+    spec = _spec_for_cls(cls, '__only_on__', '_sa_only_on_spec')
+    if spec is not None:
+        all_configs = set(
+            config_obj for config_obj in all_configs
+            if spec(config_obj))
 
     if getattr(cls, '__only_on_config__', None):
         all_configs.intersection_update([cls.__only_on_config__])
 
     if hasattr(cls, '__requires__'):
-        requirements = config.requirements
-        for config_obj in list(all_configs):
+        unsupported = set()
+        for config_obj in all_configs:
             for requirement in cls.__requires__:
-                check = getattr(requirements, requirement)
-
-                skip_reasons = check.matching_config_reasons(config_obj)
+                skip_reasons = _requirement_reasons(requirement, config_obj)
                 if skip_reasons:
-                    all_configs.remove(config_obj)
+                    unsupported.add(config_obj)
                     if reasons is not None:
                         reasons.extend(skip_reasons)
                     break
+        all_configs.difference_update(unsupported)
 
     if hasattr(cls, '__prefer_requires__'):
         non_preferred = set()
-        requirements = config.requirements
-        for config_obj in list(all_configs):
+        for config_obj in all_configs:
             for requirement in cls.__prefer_requires__:
-                check = getattr(requirements, requirement)
-
-                if not check.enabled_for_config(config_obj):
+                if _requirement_reasons(requirement, config_obj):
                     non_preferred.add(config_obj)
+                    break
         if all_configs.difference(non_preferred):
             all_configs.difference_update(non_preferred)
 
     return all_configs
 
 
+def _spec_for_cls(cls, attrname, cache_attrname):
+    """Return an :func:`.exclusions.db_spec` for a class-level list of
+    backends, or None if the attribute is not set.
+
+    The spec is compiled once per class and stored on the class itself.
+
+    """
+    try:
+        return cls.__dict__[cache_attrname]
+    except KeyError:
+        backends = getattr(cls, attrname, None)
+        if backends:
+            spec = exclusions.db_spec(*util.to_list(backends))
+        else:
+            spec = None
+        setattr(cls, cache_attrname, spec)
+        return spec
+
+
+_requirement_reasons_cache = {}
+
+
+def _requirement_reasons(requirement, config_obj):
+    """Return the reasons the named requirement excludes the given
+    config, or an empty list if it doesn't.
+
+    Many test classes share the same requirements, so the result is
+    computed once per requirement / config pair.
+
+    """
+    key = (requirement, config_obj)
+    try:
+        return _requirement_reasons_cache[key]
+    except KeyError:
+        check = getattr(config.requirements, requirement)
+        reasons = _requirement_reasons_cache[key] = \
+            check.matching_config_reasons(config_obj)
+        return reasons
+
+
+_skip_check_attrs = (
+    '__requires__', '__prefer_requires__', '__unsupported_on__',
+    '__only_on__', '__only_on_config__', '__skip_if__',
+    '__prefer_backends__'
+)
+
+
+def _needs_skip_check(cls):
+    """Return True if the class sets any attribute that may skip it
+    or restrict the configs it runs against.
+
+    The result is stored on the class itself.
+
+    """
+    try:
+        return cls.__dict__['_sa_needs_skip_check']
+    except KeyError:
+        needs_check = any(
+            getattr(cls, attrname, None) for attrname in _skip_check_attrs)
+        cls._sa_needs_skip_check = needs_check
+        return needs_check
+
+
 def _do_skips(cls):
-    reasons = []
-    all_configs = _possible_configs_for_cls(cls, reasons)
+    # most classes don't restrict backends at all; these run on
+    # the current config as long as it's a registered one
+    if not _needs_skip_check(cls) and \
+            config._current in config.Config._all_configs_frozenset:
+        return
+
+    all_configs = _possible_configs_for_cls(cls)
 
     if getattr(cls, '__skip_if__', False):
         for c in getattr(cls, '__skip_if__'):
@@ -554,6 +692,10 @@ def _do_skips(cls):
                 )
 
     if not all_configs:
+        # skip reasons are only gathered once we know we're skipping
+        reasons = []
+        _compute_possible_configs_for_cls(cls, reasons)
+
         msg = "'%s' unsupported on any DB implementation %s%s" % (
             cls.__name__,
             ", ".join(
@@ -569,9 +711,11 @@ def _do_skips(cls):
             ", ".join(reasons)
         )
         config.skip_test(msg)
-    elif hasattr(cls, '__prefer_backends__'):
+
+    spec = _spec_for_cls(
+        cls, '__prefer_backends__', '_sa_prefer_backends_spec')
+    if spec is not None:
         non_preferred = set()
-        spec = exclusions.db_spec(*util.to_list(cls.__prefer_backends__))
         for config_obj in all_configs:
             if not spec(config_obj):
                 non_preferred.add(config_obj)
@@ -59,6 +59,9 @@ def setup_config(db_url, options, file_config, follower_ident):
     _update_db_opts(db_url, db_opts)
     eng = engines.testing_engine(db_url, db_opts)
     _post_configure_engine(db_url, eng, follower_ident)
+
+    # connecting up front initializes the dialect, which Config needs
+    # for the server version in its name.
     eng.connect().close()
 
     cfg = config.Config.register(eng, db_opts, options, file_config)